@@ -3,8 +3,10 @@ import os
 from server.onedrive_client import OneDriveClient
 from server.document_processor import DocumentProcessor
 from server.llm_service import LLMService
-from utils.helpers import format_file_size, truncate_text
+from utils.helpers import content_hash, format_file_size, truncate_text
 import asyncio
+import atexit
+import threading
 import traceback
 
 # Initialize session state
@@ -16,17 +18,160 @@ if 'document_content' not in st.session_state:
     st.session_state.document_content = None
 if 'original_content' not in st.session_state:
     st.session_state.original_content = None
+# Hashes are updated alongside the content so change checks don't compare whole documents
+if 'document_hash' not in st.session_state:
+    st.session_state.document_hash = None
+if 'original_hash' not in st.session_state:
+    st.session_state.original_hash = None
 if 'onedrive_files' not in st.session_state:
     st.session_state.onedrive_files = []
+if 'insights_future' not in st.session_state:
+    st.session_state.insights_future = None
 
 # Initialize services
 @st.cache_resource
 def get_services():
-    return {
+    # One long-lived event loop, so OneDrive connections are pooled across clicks
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    
+    services = {
         'onedrive': OneDriveClient(),
         'doc_processor': DocumentProcessor(),
-        'llm': LLMService()
+        'llm': LLMService(),
+        'loop': loop
     }
+    
+    # Close pooled OneDrive connections cleanly when the server shuts down
+    atexit.register(
+        lambda: asyncio.run_coroutine_threadsafe(services['onedrive'].aclose(), loop).result(timeout=5)
+    )
+    return services
+
+def submit_async(coro):
+    """Schedule a coroutine on the shared service loop without waiting for it"""
+    return asyncio.run_coroutine_threadsafe(coro, get_services()['loop'])
+
+def run_async(coro, on_poll=None):
+    """Run a coroutine on the shared service loop and wait for its result"""
+    future = submit_async(coro)
+    if on_poll is None:
+        return future.result()
+    
+    # Widgets can only be updated from the script thread, so poll while waiting
+    while True:
+        try:
+            return future.result(timeout=0.1)
+        except TimeoutError:
+            on_poll()
+
+async def load_document_text(file_id):
+    """Download a document and extract its text without blocking the service loop"""
+    services = get_services()
+    with await services['onedrive'].download_document(file_id) as content:
+        # python-docx needs the zip's central directory at the end of the file,
+        # so parsing starts once the download completes, on the processor's pool
+        return await asyncio.wrap_future(services['doc_processor'].extract_text_async(content))
+
+async def save_document(file_id, text_content, progress_callback=None):
+    """Build the .docx off the script thread and upload it to OneDrive"""
+    services = get_services()
+    doc_bytes = await asyncio.wrap_future(services['doc_processor'].create_document_async(text_content))
+    return await services['onedrive'].upload_document(file_id, doc_bytes, progress_callback=progress_callback)
+
+async def gather_document_insights(doc_text):
+    """Run the document analysis and summary concurrently"""
+    llm = get_services()['llm']
+    # A failure in one shouldn't hide the other, so exceptions are returned as results
+    analysis, summary = await asyncio.gather(
+        llm.aanalyze_document(doc_text),
+        llm.asummarize_document(doc_text, "short"),
+        return_exceptions=True
+    )
+    return {'analysis': analysis, 'summary': summary}
+
+@st.fragment(run_every=2)
+def render_pending_insights():
+    """Show a placeholder until the background insights finish, then redraw the page"""
+    if st.session_state.insights_future.done():
+        st.rerun()
+    st.caption("Analyzing document...")
+
+def render_document_insights():
+    """Render the summary and improvement suggestions gathered when the document loaded"""
+    insights_future = st.session_state.insights_future
+    if insights_future is None:
+        return
+    
+    with st.expander("💡 Document Insights", expanded=False):
+        if not insights_future.done():
+            render_pending_insights()
+            return
+        
+        insights = insights_future.result()
+        
+        st.markdown("**Summary**")
+        if isinstance(insights['summary'], Exception):
+            st.caption(f"Summary unavailable: {str(insights['summary'])}")
+        else:
+            st.write(insights['summary'])
+        
+        st.markdown("**Improvement Suggestions**")
+        if isinstance(insights['analysis'], Exception):
+            st.caption(f"Analysis unavailable: {str(insights['analysis'])}")
+        else:
+            for suggestion in insights['analysis'].get("improvement_suggestions", []):
+                st.markdown(f"- {suggestion}")
+
+# The preview and history tabs are fragments, so interacting with them reruns
+# only the tab instead of the whole page with its large text areas
+@st.fragment
+def render_document_preview():
+    """Render the original and edited document text side by side"""
+    st.subheader("Document Preview")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("**Original Content**")
+        st.text_area(
+            "Original",
+            value=st.session_state.original_content or "No content loaded",
+            height=400,
+            disabled=True,
+            key="original_preview"
+        )
+    
+    with col2:
+        st.markdown("**Current Content** (with edits)")
+        st.text_area(
+            "Current",
+            value=st.session_state.document_content or "No content loaded",
+            height=400,
+            disabled=True,
+            key="current_preview"
+        )
+    
+    # Show if there are unsaved changes
+    if st.session_state.document_hash != st.session_state.original_hash:
+        st.warning("⚠️ You have unsaved changes")
+
+@st.fragment
+def render_chat_history():
+    """Render the conversation history"""
+    st.subheader("Conversation History")
+    
+    if st.session_state.conversation_history:
+        for i, message in enumerate(st.session_state.conversation_history):
+            with st.chat_message(message["role"]):
+                st.write(message["content"])
+                if "timestamp" in message:
+                    st.caption(f"Timestamp: {message['timestamp']}")
+        
+        # Clear history button; the callback runs before the fragment redraws
+        st.button("🗑️ Clear History", on_click=st.session_state.conversation_history.clear)
+    else:
+        st.info("No conversation history yet. Start chatting to see messages here!")
 
 def main():
     st.set_page_config(
@@ -46,7 +191,7 @@ def main():
         if st.button("🔄 Refresh Files", use_container_width=True):
             with st.spinner("Loading OneDrive files..."):
                 try:
-                    files = asyncio.run(services['onedrive'].list_word_documents())
+                    files = run_async(services['onedrive'].list_word_documents())
                     st.session_state.onedrive_files = files
                     st.success(f"Found {len(files)} Word documents")
                 except Exception as e:
@@ -63,11 +208,15 @@ def main():
                     if st.button(f"📄 {file_name}", key=f"file_{file['id']}", use_container_width=True):
                         with st.spinner("Loading document..."):
                             try:
-                                content = asyncio.run(services['onedrive'].download_document(file['id']))
-                                doc_text = services['doc_processor'].extract_text(content)
+                                doc_text = run_async(load_document_text(file['id']))
+                                
+                                # Start analysing right away so insights are ready when the user looks
+                                st.session_state.insights_future = submit_async(gather_document_insights(doc_text))
                                 st.session_state.current_document = file
                                 st.session_state.document_content = doc_text
                                 st.session_state.original_content = doc_text
+                                st.session_state.document_hash = content_hash(doc_text)
+                                st.session_state.original_hash = st.session_state.document_hash
                                 st.success(f"Loaded: {file['name']}")
                                 st.rerun()
                             except Exception as e:
@@ -91,16 +240,10 @@ def main():
             # Chat interface
             st.subheader("Chat with AI Assistant")
             
-            # Display current document content in an expandable section
-            with st.expander("📖 Current Document Content", expanded=False):
-                if st.session_state.document_content:
-                    st.text_area(
-                        "Document Text",
-                        value=st.session_state.document_content,
-                        height=300,
-                        disabled=True,
-                        key="doc_preview"
-                    )
+            render_document_insights()
+            
+            # Filled in after the chat input is handled, so it shows this run's edit
+            document_slot = st.container()
             
             # Chat input
             user_message = st.chat_input("Ask me to edit your document... (e.g., 'Make it more professional', 'Add bullet points', 'Fix grammar')")
@@ -114,16 +257,25 @@ def main():
                     "timestamp": datetime.now().isoformat()
                 })
                 
-                with st.spinner("AI is processing your request..."):
+                with st.status("AI is processing your request...", expanded=True) as status:
                     try:
-                        # Get AI response and edited content
-                        response = services['llm'].process_edit_request(
+                        # Show the explanation as it streams; the edits arrive with the raw JSON
+                        raw_chunks = []
+                        st.write_stream(services['llm'].stream_edit_explanation(
+                            st.session_state.document_content,
+                            user_message,
+                            raw_chunks
+                        ))
+                        status.update(label="AI response received", state="complete", expanded=False)
+                        response = services['llm'].parse_edit_response(
+                            "".join(raw_chunks),
                             st.session_state.document_content,
                             user_message
                         )
                         
                         # Update document content
                         st.session_state.document_content = response['edited_content']
+                        st.session_state.document_hash = content_hash(response['edited_content'])
                         
                         # Add AI response to history
                         st.session_state.conversation_history.append({
@@ -133,9 +285,9 @@ def main():
                         })
                         
                         st.success("Document updated successfully!")
-                        st.rerun()
                         
                     except Exception as e:
+                        status.update(state="error")
                         error_msg = f"Failed to process request: {str(e)}"
                         st.error(error_msg)
                         st.session_state.conversation_history.append({
@@ -144,25 +296,41 @@ def main():
                             "timestamp": datetime.now().isoformat()
                         })
             
+            # Display current document content in an expandable section
+            with document_slot:
+                with st.expander("📖 Current Document Content", expanded=False):
+                    # Only send the full text to the browser when asked for
+                    if st.toggle("Show document text", key="show_preview") and st.session_state.document_content:
+                        st.text_area(
+                            "Document Text",
+                            value=st.session_state.document_content,
+                            height=300,
+                            disabled=True,
+                            key="doc_preview"
+                        )
+            
             # Save document button
             col1, col2, col3 = st.columns([1, 1, 1])
             with col2:
                 if st.button("💾 Save to OneDrive", use_container_width=True, type="primary"):
-                    if st.session_state.document_content != st.session_state.original_content:
+                    if st.session_state.document_hash != st.session_state.original_hash:
                         with st.spinner("Saving document to OneDrive..."):
                             try:
-                                # Create new document with edited content
-                                new_doc_bytes = services['doc_processor'].create_document(
-                                    st.session_state.document_content
+                                # Create new document with edited content and upload it to OneDrive
+                                progress_bar = st.progress(0.0, text="Uploading...")
+                                upload_progress = {'fraction': 0.0}
+                                run_async(
+                                    save_document(
+                                        st.session_state.current_document['id'],
+                                        st.session_state.document_content,
+                                        progress_callback=lambda sent, total: upload_progress.update(fraction=sent / total)
+                                    ),
+                                    on_poll=lambda: progress_bar.progress(upload_progress['fraction'], text="Uploading...")
                                 )
-                                
-                                # Upload to OneDrive
-                                asyncio.run(services['onedrive'].upload_document(
-                                    st.session_state.current_document['id'],
-                                    new_doc_bytes
-                                ))
+                                progress_bar.empty()
                                 
                                 st.session_state.original_content = st.session_state.document_content
+                                st.session_state.original_hash = st.session_state.document_hash
                                 st.success("✅ Document saved successfully!")
                                 
                             except Exception as e:
@@ -171,52 +339,10 @@ def main():
                         st.info("No changes to save")
         
         with tab2:
-            # Document preview
-            st.subheader("Document Preview")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Original Content**")
-                st.text_area(
-                    "Original",
-                    value=st.session_state.original_content or "No content loaded",
-                    height=400,
-                    disabled=True,
-                    key="original_preview"
-                )
-            
-            with col2:
-                st.markdown("**Current Content** (with edits)")
-                st.text_area(
-                    "Current",
-                    value=st.session_state.document_content or "No content loaded",
-                    height=400,
-                    disabled=True,
-                    key="current_preview"
-                )
-            
-            # Show if there are unsaved changes
-            if st.session_state.document_content != st.session_state.original_content:
-                st.warning("⚠️ You have unsaved changes")
+            render_document_preview()
         
         with tab3:
-            # Chat history
-            st.subheader("Conversation History")
-            
-            if st.session_state.conversation_history:
-                for i, message in enumerate(st.session_state.conversation_history):
-                    with st.chat_message(message["role"]):
-                        st.write(message["content"])
-                        if "timestamp" in message:
-                            st.caption(f"Timestamp: {message['timestamp']}")
-                
-                # Clear history button
-                if st.button("🗑️ Clear History"):
-                    st.session_state.conversation_history = []
-                    st.rerun()
-            else:
-                st.info("No conversation history yet. Start chatting to see messages here!")
+            render_chat_history()
     
     else:
         # Welcome screen
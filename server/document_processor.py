@@ -1,133 +1,286 @@
 from docx import Document
-from docx.shared import Inches
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+import functools
+import hashlib
 import io
-from typing import List, Dict, Any, Optional
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from xml.etree import ElementTree
+from typing import IO, List, Dict, Any, Optional, Union
+
+# Number of parsed documents kept so repeated analysis of the same bytes skips re-parsing
+_DOCUMENT_CACHE_SIZE = 4
+
+_W_BODY = qn('w:body')
+_W_P = qn('w:p')
+_W_TBL = qn('w:tbl')
+_W_TR = qn('w:tr')
+_W_TC = qn('w:tc')
+_W_R = qn('w:r')
+_W_T = qn('w:t')
+_W_TAB = qn('w:tab')
+_W_BR = qn('w:br')
+_W_CR = qn('w:cr')
+_W_HYPERLINK = qn('w:hyperlink')
+_W_TYPE = qn('w:type')
+
+# Text equivalents of the other run children python-docx's Run.text reads
+_RUN_CHARACTERS = {
+    _W_TAB: "\t",
+    qn('w:ptab'): "\t",
+    _W_CR: "\n",
+    qn('w:noBreakHyphen'): "-",
+}
+
+# Built-in paragraph styles reported as headings; other names fall back to the 'Heading' substring check
+_HEADING_STYLES = frozenset(f"Heading {i}" for i in range(1, 10)) | {"Title", "Subtitle"}
+
+def _paragraph_text(p) -> str:
+    """Get the text of a <w:p> element the way python-docx's Paragraph.text does"""
+    # Only runs directly in the paragraph or in a hyperlink count; a deep search would
+    # also pick up text boxes, which Word stores twice (mc:Choice and mc:Fallback)
+    parts = []
+    for child in p.iterchildren(_W_R, _W_HYPERLINK):
+        for r in (child,) if child.tag == _W_R else child.iterchildren(_W_R):
+            for node in r.iterchildren():
+                tag = node.tag
+                if tag == _W_T:
+                    parts.append(node.text or "")
+                elif tag == _W_BR:
+                    # Page and column breaks have no text equivalent
+                    if node.get(_W_TYPE, 'textWrapping') == 'textWrapping':
+                        parts.append("\n")
+                else:
+                    parts.append(_RUN_CHARACTERS.get(tag, ""))
+    return "".join(parts)
+
+@functools.lru_cache(maxsize=1)
+def _template_bytes() -> bytes:
+    """Get python-docx's default template as bytes, loaded from its package once"""
+    doc_io = io.BytesIO()
+    Document().save(doc_io)
+    return doc_io.getvalue()
+
+def _table_rows(tbl) -> List[List[str]]:
+    """Get the stripped text of each cell in a <w:tbl> element, row by row, like python-docx's row.cells"""
+    # Reading the cells straight from the XML avoids building python-docx's row and
+    # cell proxies. A cell spanning several grid columns is repeated once per column,
+    # and a vertically merged cell repeats the text of the cell it continues
+    rows = []
+    above: Dict[int, str] = {}
+    for tr in tbl.iterchildren(_W_TR):
+        row = []
+        current: Dict[int, str] = {}
+        column = tr.grid_before
+        for tc in tr.iterchildren(_W_TC):
+            if tc.vMerge == "continue":
+                text = above.get(column, "")
+            else:
+                text = "\n".join(_paragraph_text(p) for p in tc.iterchildren(_W_P)).strip()
+            span = tc.grid_span
+            row.extend([text] * span)
+            current[column] = text
+            column += span
+        rows.append(row)
+        above = current
+    return rows
+
+def _word_count(text: str) -> int:
+    """Count whitespace-separated words"""
+    # str.split runs entirely in C and beats both a regex scan and a JIT-compiled
+    # byte loop, which would also have to encode every paragraph first
+    return len(text.split())
 
 class DocumentProcessor:
     """Handles reading and writing Word documents"""
     
     def __init__(self):
-        pass
+        self._document_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Parsing and saving happen here rather than on the caller's thread;
+        # lxml releases the GIL while it parses
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="docx")
     
-    def extract_text(self, doc_bytes: bytes) -> str:
-        """Extract text content from a Word document"""
+    def _load_document(self, src: Union[bytes, IO[bytes]]):
+        """Parse a document with python-docx, reusing recent parses of the same bytes"""
+        if hasattr(src, 'read'):
+            src.seek(0)
+            return Document(src)
+        
+        key = hashlib.blake2b(src, digest_size=16).digest()
+        with self._cache_lock:
+            doc = self._document_cache.get(key)
+            if doc is not None:
+                self._document_cache.move_to_end(key)
+                return doc
+        
+        doc = Document(io.BytesIO(src))
+        with self._cache_lock:
+            self._document_cache[key] = doc
+            while len(self._document_cache) > _DOCUMENT_CACHE_SIZE:
+                self._document_cache.popitem(last=False)
+        return doc
+    
+    def _read_body(self, src: Union[bytes, IO[bytes]]):
+        """Parse only the main document part, skipping python-docx's package loading"""
+        if hasattr(src, 'read'):
+            src.seek(0)
+        with zipfile.ZipFile(src if hasattr(src, 'read') else io.BytesIO(src)) as package:
+            try:
+                xml = package.read('word/document.xml')
+            except KeyError:
+                # Non-standard part name; let python-docx resolve it through the relationships
+                return self._load_document(src).element.body
+        return parse_xml(xml).find(_W_BODY)
+    
+    def extract_text(self, src: Union[bytes, IO[bytes]]) -> str:
+        """Extract text content from a Word document given as bytes or a file-like object"""
         try:
-            doc = Document(io.BytesIO(doc_bytes))
-            
-            # Extract text from paragraphs
-            paragraphs = []
-            for paragraph in doc.paragraphs:
-                text = paragraph.text.strip()
-                if text:  # Skip empty paragraphs
-                    paragraphs.append(text)
-            
-            # Extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        cell_text = cell.text.strip()
-                        if cell_text:
-                            row_text.append(cell_text)
-                    if row_text:
-                        paragraphs.append(" | ".join(row_text))
+            body = self._read_body(src)
+            
+            # Extract text from paragraphs, skipping empty ones
+            paragraphs = [text for p in body.iterchildren(_W_P) if (text := _paragraph_text(p).strip())]
+            
+            # Extract text from tables, one line per non-empty row
+            paragraphs.extend(
+                " | ".join(row_text)
+                for tbl in body.iterchildren(_W_TBL)
+                for row in _table_rows(tbl)
+                if (row_text := [cell_text for cell_text in row if cell_text])
+            )
             
             return "\n\n".join(paragraphs)
             
         except Exception as e:
             raise Exception(f"Failed to extract text from document: {str(e)}")
     
+    def extract_text_async(self, src: Union[bytes, IO[bytes]]) -> Future:
+        """Run extract_text on the processor's worker pool"""
+        return self._pool.submit(self.extract_text, src)
+    
+    def create_document_async(self, text_content: str) -> Future:
+        """Run create_document on the processor's worker pool"""
+        return self._pool.submit(self.create_document, text_content)
+    
     def create_document(self, text_content: str) -> bytes:
         """Create a new Word document from text content"""
         try:
-            doc = Document()
+            doc = Document(io.BytesIO(_template_bytes()))
             
             # Split content into paragraphs
             paragraphs = text_content.split('\n\n')
             
+            # Without any | there can be no table rows, so skip the per-paragraph check
+            if '|' not in text_content:
+                for paragraph_text in paragraphs:
+                    paragraph_text = paragraph_text.strip()
+                    if paragraph_text:
+                        doc.add_paragraph(paragraph_text)
+                return self._save(doc)
+            
             for paragraph_text in paragraphs:
                 paragraph_text = paragraph_text.strip()
                 if paragraph_text:
-                    # Check if this looks like a table row (contains |)
-                    if '|' in paragraph_text and paragraph_text.count('|') >= 2:
+                    # Check if this looks like a table row (at least two |)
+                    if paragraph_text.count('|') >= 2:
                         # Create table
                         cells = [cell.strip() for cell in paragraph_text.split('|')]
-                        if len(cells) > 1:
-                            table = doc.add_table(rows=1, cols=len(cells))
-                            table.style = 'Table Grid'
-                            row = table.rows[0]
-                            for i, cell_text in enumerate(cells):
-                                if i < len(row.cells):
-                                    row.cells[i].text = cell_text
+                        table = doc.add_table(rows=1, cols=len(cells))
+                        table.style = 'Table Grid'
+                        # row.cells rebuilds the cell list on every access, so fetch it once
+                        for cell, cell_text in zip(table.rows[0].cells, cells):
+                            cell.text = cell_text
                     else:
                         # Regular paragraph
                         doc.add_paragraph(paragraph_text)
             
-            # Save to bytes
-            doc_io = io.BytesIO()
-            doc.save(doc_io)
-            doc_io.seek(0)
-            return doc_io.getvalue()
+            return self._save(doc)
             
         except Exception as e:
             raise Exception(f"Failed to create document: {str(e)}")
     
+    def _save(self, doc) -> bytes:
+        """Serialize a document to .docx bytes"""
+        doc_io = io.BytesIO()
+        doc.save(doc_io)
+        return doc_io.getvalue()
+    
     def extract_document_structure(self, doc_bytes: bytes) -> Dict[str, Any]:
         """Extract detailed structure information from document"""
         try:
-            doc = Document(io.BytesIO(doc_bytes))
+            doc = self._load_document(doc_bytes)
             
             structure = {
                 'paragraphs': [],
                 'tables': [],
                 'headings': [],
                 'word_count': 0,
-                'paragraph_count': len(doc.paragraphs)
+                'paragraph_count': 0
+            }
+            
+            # Resolve paragraph style names once instead of through each paragraph's proxy
+            style_names = {
+                style.style_id: style.name
+                for style in doc.styles
+                if style.type == WD_STYLE_TYPE.PARAGRAPH
             }
+            default_style = doc.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+            default_style_name = default_style.name if default_style else 'Normal'
             
             word_count = 0
+            paragraph_index = 0
+            table_index = 0
             
-            # Analyze paragraphs
-            for i, paragraph in enumerate(doc.paragraphs):
-                text = paragraph.text.strip()
-                if text:
+            # Walk the body once, in document order, handling paragraphs and tables as they come
+            for child in doc.element.body.iterchildren():
+                if child.tag == _W_P:
+                    i = paragraph_index
+                    paragraph_index += 1
+                    
+                    text = _paragraph_text(child).strip()
+                    if not text:
+                        continue
+                    
+                    style_name = style_names.get(child.style) or default_style_name
                     para_info = {
                         'index': i,
                         'text': text,
-                        'style': paragraph.style.name if paragraph.style else 'Normal',
-                        'word_count': len(text.split())
+                        'style': style_name,
+                        'word_count': _word_count(text)
                     }
                     
                     structure['paragraphs'].append(para_info)
                     word_count += para_info['word_count']
                     
                     # Check if it's a heading
-                    if paragraph.style and paragraph.style.name and 'Heading' in paragraph.style.name:
+                    if style_name in _HEADING_STYLES or 'Heading' in style_name:
                         structure['headings'].append({
-                            'level': paragraph.style.name,
+                            'level': style_name,
                             'text': text,
                             'index': i
                         })
-            
-            # Analyze tables
-            for i, table in enumerate(doc.tables):
-                table_info = {
-                    'index': i,
-                    'rows': len(table.rows),
-                    'cols': len(table.columns) if table.rows else 0,
-                    'content': []
-                }
                 
-                for row in table.rows:
-                    row_content = []
-                    for cell in row.cells:
-                        cell_text = cell.text.strip()
-                        row_content.append(cell_text)
-                        word_count += len(cell_text.split())
-                    table_info['content'].append(row_content)
-                
-                structure['tables'].append(table_info)
+                elif child.tag == _W_TBL:
+                    rows = _table_rows(child)
+                    table_info = {
+                        'index': table_index,
+                        'rows': len(rows),
+                        'cols': len(child.tblGrid.gridCol_lst) if rows else 0,
+                        'content': rows
+                    }
+                    table_index += 1
+                    
+                    for row_content in rows:
+                        for cell_text in row_content:
+                            word_count += _word_count(cell_text)
+                    
+                    structure['tables'].append(table_info)
             
+            structure['paragraph_count'] = paragraph_index
             structure['word_count'] = word_count
             return structure
             
@@ -151,39 +304,29 @@ class DocumentProcessor:
     def validate_document(self, doc_bytes: bytes) -> Dict[str, Any]:
         """Validate that the document can be processed"""
         try:
-            doc = Document(io.BytesIO(doc_bytes))
+            # Stream the main part and stop at the first run with real text,
+            # which in most documents is near the top
+            with zipfile.ZipFile(io.BytesIO(doc_bytes)) as package:
+                with package.open('word/document.xml') as stream:
+                    for _, element in ElementTree.iterparse(stream, events=('end',)):
+                        if element.tag == _W_T and element.text and element.text.strip():
+                            return {
+                                'valid': True,
+                                'has_content': True,
+                                'errors': []
+                            }
             
-            validation = {
+            # Only an empty document pays for the full parse needed for the counts
+            doc = self._load_document(doc_bytes)
+            
+            return {
                 'valid': True,
                 'paragraph_count': len(doc.paragraphs),
                 'table_count': len(doc.tables),
                 'has_content': False,
-                'errors': []
+                'errors': ["Document appears to be empty"]
             }
             
-            # Check if document has any content
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    validation['has_content'] = True
-                    break
-            
-            if not validation['has_content']:
-                for table in doc.tables:
-                    for row in table.rows:
-                        for cell in row.cells:
-                            if cell.text.strip():
-                                validation['has_content'] = True
-                                break
-                        if validation['has_content']:
-                            break
-                    if validation['has_content']:
-                        break
-            
-            if not validation['has_content']:
-                validation['errors'].append("Document appears to be empty")
-            
-            return validation
-            
         except Exception as e:
             return {
                 'valid': False,
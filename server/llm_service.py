@@ -1,24 +1,25 @@
 import os
-import json
+import functools
+import hashlib
+import re
+import threading
+import time
+import orjson
+from collections import OrderedDict
+from dataclasses import dataclass
 from google import genai
 from google.genai import types
-from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, Iterator, List, Literal, Optional
 
-class LLMService:
-    """Service for LLM-powered document editing"""
-    
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise Exception("GEMINI_API_KEY environment variable is required")
-        
-        self.client = genai.Client(api_key=api_key)
-        self.model = "gemini-2.5-flash"
-    
-    def process_edit_request(self, document_content: str, user_request: str) -> Dict[str, Any]:
-        """Process a user's edit request for a document"""
-        try:
-            system_prompt = """You are an expert document editor and writing assistant. Your task is to help users edit and improve their Microsoft Word documents based on their specific requests.
+# Folded into response cache keys; bump it whenever a prompt changes so stale
+# responses are never served for the new wording
+PROMPT_VERSION = "v3"
+_RESPONSE_CACHE_SIZE = 256
+_RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Prompts are built once here; any wording change needs a PROMPT_VERSION bump
+_EDIT_SYSTEM_PROMPT = """You are an expert document editor and writing assistant. Your task is to help users edit and improve their Microsoft Word documents based on their specific requests.
 
 When given a document and an edit request:
 1. Analyze the user's request carefully
@@ -26,85 +27,378 @@ When given a document and an edit request:
 3. Maintain the document's overall structure and formatting intent
 4. Provide a clear explanation of what changes you made
 
-Respond with JSON in this exact format:
+Respond with JSON in this exact format, keeping the keys in this order:
 {
-    "edited_content": "The complete edited document text",
     "explanation": "A clear explanation of the changes made",
-    "changes_summary": "Brief summary of key changes"
+    "changes_summary": "Brief summary of key changes",
+    "edits": [
+        {"op": "replace", "index": 0, "text": "The new text of paragraph 0"}
+    ]
 }
 
+The document is given as numbered paragraphs such as "[3] Some text". Each edit refers to a paragraph number of the document as given:
+- "replace": replace paragraph "index" with "text"
+- "insert": insert "text" as a new paragraph before paragraph "index" (use the number of paragraphs to add at the end)
+- "delete": remove paragraph "index"
+
 Important guidelines:
+- Only include paragraphs that change; never repeat unchanged paragraphs
+- Do not include the [n] paragraph numbers in the text you return
 - Keep the same paragraph structure unless specifically asked to change it
 - Preserve important information while making requested improvements
 - If the request is unclear, make reasonable assumptions and explain them
-- For table-like content with | separators, maintain that format
-- Always provide the complete edited document, not just the changes"""
+- For table-like content with | separators, maintain that format"""
 
-            user_prompt = f"""Document Content:
-{document_content}
+_ANALYSIS_SYSTEM_PROMPT = """You are a document analysis expert. Analyze the given document and provide insights about its structure, content, and potential improvements.
 
-User Request: {user_request}
+Respond with JSON in this format:
+{
+    "word_count": estimated_word_count,
+    "document_type": "type of document (e.g., report, letter, article)",
+    "tone": "writing tone (e.g., formal, casual, academic)",
+    "structure_analysis": "analysis of document structure",
+    "improvement_suggestions": ["list", "of", "improvement", "suggestions"],
+    "key_topics": ["main", "topics", "covered"]
+}"""
+
+_EDIT_REQUEST_PROMPT = """User Request: {user_request}
 
 Please edit the document according to the user's request and respond with the JSON format specified."""
 
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=user_prompt)])
-                ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    response_mime_type="application/json"
-                )
+_CHAT_SYSTEM_PROMPT = "You are a helpful assistant for document editing. Provide clear, concise responses to user questions about document editing, writing, and content improvement."
+
+_SUMMARY_LENGTHS = {
+    "short": "in 2-3 sentences",
+    "medium": "in 1-2 paragraphs",
+    "long": "in 3-4 paragraphs with key details"
+}
+
+@dataclass
+class _CacheEntry:
+    """A cached response and when it stops being served"""
+    text: str
+    expires_at: float
+
+class ParagraphEdit(BaseModel):
+    """One paragraph-level change to a document"""
+    op: Literal["replace", "insert", "delete"]
+    index: int
+    text: str = ""
+
+class EditResult(BaseModel):
+    """Structured response to an edit request"""
+    explanation: str
+    changes_summary: str
+    edits: List[ParagraphEdit]
+
+class _ResponseCache:
+    """Thread-safe LRU cache of model responses with a fixed time to live"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a live cached response, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry.text
+    
+    def put(self, key: str, text: str) -> None:
+        """Store a response, evicting the least recently used ones past maxsize"""
+        if not text:
+            return
+        with self._lock:
+            self._entries[key] = _CacheEntry(text, time.time() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+@functools.lru_cache(maxsize=1)
+def _genai_client(api_key: str) -> genai.Client:
+    """Get the Gemini client shared by every LLMService, so its connection pool stays warm"""
+    # The SDK retries 408, 429 and 5xx responses with jittered exponential backoff,
+    # including the request that opens a stream
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            retry_options=types.HttpRetryOptions(attempts=5, initial_delay=1.0, max_delay=16.0)
+        )
+    )
+
+def _number_paragraphs(document_content: str) -> str:
+    """Prefix each paragraph with its index so the model can address it in edits"""
+    return "\n\n".join(f"[{i}] {paragraph}" for i, paragraph in enumerate(document_content.split('\n\n')))
+
+def _document_turn(numbered_content: str) -> types.Content:
+    """Build the user turn that carries the document, identical for every edit of it"""
+    return types.Content(role="user", parts=[types.Part(text=f"Document Content:\n{numbered_content}")])
+
+class _ExplanationDecoder:
+    """Incrementally decode the "explanation" string of a streamed edit response"""
+    
+    _START = re.compile(r'"explanation"\s*:\s*"')
+    
+    def __init__(self):
+        self._buffer = ""
+        self._pos: Optional[int] = None  # Start of the undecoded part of the value
+        self._done = False
+    
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of raw JSON and return the explanation text it completes"""
+        if self._done:
+            return ""
+        self._buffer += chunk
+        
+        if self._pos is None:
+            match = self._START.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+        
+        # Take characters up to the closing quote, stopping early before an
+        # escape sequence whose end hasn't arrived yet
+        buffer, start, i = self._buffer, self._pos, self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            if ch == '"':
+                self._done = True
+                break
+            if ch != '\\':
+                i += 1
+                continue
+            if i + 1 >= len(buffer):
+                break
+            if buffer[i + 1] != 'u':
+                i += 2
+                continue
+            # A high surrogate is only decodable together with the escape after it
+            end = i + 6
+            if end <= len(buffer) and 0xD800 <= int(buffer[i + 2:end], 16) <= 0xDBFF:
+                end += 6
+            if end > len(buffer):
+                break
+            i = end
+        
+        self._pos = i
+        return orjson.loads(f'"{buffer[start:i]}"') if i > start else ""
+
+def _apply_edits(document_content: str, edits: List[Dict[str, Any]]) -> str:
+    """Apply replace/insert/delete edits addressed by original paragraph index"""
+    paragraphs: List[Optional[str]] = list(document_content.split('\n\n'))
+    inserts: Dict[int, List[str]] = {}
+    
+    for edit in edits:
+        op = edit.get('op', 'replace')
+        index = int(edit['index'])
+        if op == 'insert' and 0 <= index <= len(paragraphs):
+            inserts.setdefault(index, []).append(edit.get('text', ''))
+        elif not 0 <= index < len(paragraphs):
+            raise Exception(f"Edit refers to paragraph {index}, but the document has {len(paragraphs)}")
+        elif op == 'delete':
+            paragraphs[index] = None
+        elif op == 'replace':
+            paragraphs[index] = edit.get('text', '')
+        else:
+            raise Exception(f"Unknown edit operation: {op}")
+    
+    result = []
+    for i, paragraph in enumerate(paragraphs):
+        result.extend(inserts.get(i, []))
+        if paragraph is not None:
+            result.append(paragraph)
+    result.extend(inserts.get(len(paragraphs), []))
+    
+    return "\n\n".join(result)
+
+class LLMService:
+    """Service for LLM-powered document editing"""
+    
+    def __init__(self):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise Exception("GEMINI_API_KEY environment variable is required")
+        
+        self.client = _genai_client(api_key)
+        self.model = "gemini-2.5-flash"
+        
+        # Identical requests (re-running an edit, reloading a document) are answered from here
+        self._response_cache = _ResponseCache(_RESPONSE_CACHE_SIZE, _RESPONSE_CACHE_TTL_SECONDS)
+    
+    def _response_key(self, kind: str, *inputs: Optional[str]) -> str:
+        """Get the response cache key for a request of the given kind and inputs"""
+        # The prompts themselves are fixed per kind, so PROMPT_VERSION stands in for them
+        return hashlib.sha256(orjson.dumps([PROMPT_VERSION, self.model, kind, *inputs])).hexdigest()
+    
+    def _edit_request_args(self, document_content: str, user_request: str) -> Dict[str, Any]:
+        """Build the generate_content arguments for an edit request
+        
+        The prompt runs from most to least stable: system prompt, then the document
+        in its own user turn, then the request in a final turn. Every edit of the
+        same document therefore shares a byte-identical prefix that Gemini can reuse
+        from its implicit prompt cache. Keep anything request-specific out of the
+        first two parts.
+        """
+        numbered_content = _number_paragraphs(document_content)
+        request_turn = types.Content(
+            role="user",
+            parts=[types.Part(text=_EDIT_REQUEST_PROMPT.format(user_request=user_request))]
+        )
+        
+        return {
+            'model': self.model,
+            'contents': [_document_turn(numbered_content), request_turn],
+            'config': types.GenerateContentConfig(
+                system_instruction=_EDIT_SYSTEM_PROMPT,
+                response_mime_type="application/json",
+                response_schema=EditResult
             )
-            
-            content = response.text
+        }
+    
+    def stream_edit_request(self, document_content: str, user_request: str) -> Iterator[str]:
+        """Stream the raw JSON response to an edit request as it is generated"""
+        key = self._response_key("edit", document_content, user_request)
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                **self._edit_request_args(document_content, user_request)
+            ):
+                if chunk.text:
+                    yield chunk.text
+                    
+        except Exception as e:
+            raise Exception(f"Failed to process edit request: {str(e)}")
+    
+    def stream_edit_explanation(self, document_content: str, user_request: str,
+                                raw_chunks: List[str]) -> Iterator[str]:
+        """Stream just the explanation of an edit request as it is generated
+        
+        Every raw chunk of the JSON response is appended to raw_chunks, ready for
+        parse_edit_response once the stream ends.
+        """
+        decoder = _ExplanationDecoder()
+        for chunk in self.stream_edit_request(document_content, user_request):
+            raw_chunks.append(chunk)
+            text = decoder.feed(chunk)
+            if text:
+                yield text
+    
+    def parse_edit_response(self, content: str, document_content: str,
+                            user_request: Optional[str] = None) -> Dict[str, Any]:
+        """Parse the JSON response to an edit request and apply its edits to the document
+        
+        When user_request is given, a response whose edits applied cleanly is cached
+        for that request, so stream_edit_request can replay it.
+        """
+        try:
             if not content:
                 raise Exception("Empty response from LLM")
-            result = json.loads(content)
+            # Checks the JSON and the key layout in one pass over the raw text
+            edit_result = EditResult.model_validate_json(content)
             
-            if not all(key in result for key in ["edited_content", "explanation"]):
-                raise Exception("Invalid response format from LLM")
+            result = edit_result.model_dump()
+            result["edited_content"] = _apply_edits(document_content, result["edits"])
             
+            # Only now is the response known to be usable; a bad one must not be replayed
+            if user_request is not None:
+                self._response_cache.put(self._response_key("edit", document_content, user_request), content)
             return result
             
-        except json.JSONDecodeError as e:
+        except ValidationError as e:
             raise Exception(f"Failed to parse LLM response: {str(e)}")
         except Exception as e:
             raise Exception(f"Failed to process edit request: {str(e)}")
     
+    def process_edit_request(self, document_content: str, user_request: str) -> Dict[str, Any]:
+        """Process a user's edit request for a document"""
+        return self.parse_edit_response(
+            "".join(self.stream_edit_request(document_content, user_request)),
+            document_content,
+            user_request
+        )
+    
+    def _generate(self, request: Dict[str, Any]) -> str:
+        """Run a generate_content request and return the response text"""
+        response = self.client.models.generate_content(**request)
+        return response.text or ""
+    
+    async def _agenerate(self, request: Dict[str, Any]) -> str:
+        """Run a generate_content request on the async client and return the response text"""
+        response = await self.client.aio.models.generate_content(**request)
+        return response.text or ""
+    
+    async def aprocess_edit_request(self, document_content: str, user_request: str) -> Dict[str, Any]:
+        """Process a user's edit request for a document without blocking the event loop"""
+        key = self._response_key("edit", document_content, user_request)
+        content = self._response_cache.get(key)
+        if content is None:
+            try:
+                content = await self._agenerate(self._edit_request_args(document_content, user_request))
+                
+            except Exception as e:
+                raise Exception(f"Failed to process edit request: {str(e)}")
+        
+        return self.parse_edit_response(content, document_content, user_request)
+    
+    def _analysis_args(self, document_content: str) -> Dict[str, Any]:
+        """Build the generate_content arguments for a document analysis"""
+        user_prompt = f"Please analyze this document:\n\n{document_content}"
+
+        return {
+            'model': self.model,
+            'contents': [
+                types.Content(role="user", parts=[types.Part(text=user_prompt)])
+            ],
+            'config': types.GenerateContentConfig(
+                system_instruction=_ANALYSIS_SYSTEM_PROMPT,
+                response_mime_type="application/json"
+            )
+        }
+    
+    def _parse_analysis(self, content: str) -> Dict[str, Any]:
+        """Parse the JSON response to a document analysis"""
+        if not content:
+            raise Exception("Empty response from LLM")
+        return orjson.loads(content)
+    
     def analyze_document(self, document_content: str) -> Dict[str, Any]:
         """Analyze document and provide insights"""
         try:
-            system_prompt = """You are a document analysis expert. Analyze the given document and provide insights about its structure, content, and potential improvements.
-
-Respond with JSON in this format:
-{
-    "word_count": estimated_word_count,
-    "document_type": "type of document (e.g., report, letter, article)",
-    "tone": "writing tone (e.g., formal, casual, academic)",
-    "structure_analysis": "analysis of document structure",
-    "improvement_suggestions": ["list", "of", "improvement", "suggestions"],
-    "key_topics": ["main", "topics", "covered"]
-}"""
-
-            user_prompt = f"Please analyze this document:\n\n{document_content}"
-
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=user_prompt)])
-                ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    response_mime_type="application/json"
-                )
-            )
+            key = self._response_key("analysis", document_content)
+            content = self._response_cache.get(key)
+            if content is None:
+                content = self._generate(self._analysis_args(document_content))
             
-            content = response.text
-            if not content:
-                raise Exception("Empty response from LLM")
-            return json.loads(content)
+            result = self._parse_analysis(content)
+            self._response_cache.put(key, content)
+            return result
+            
+        except Exception as e:
+            raise Exception(f"Failed to analyze document: {str(e)}")
+    
+    async def aanalyze_document(self, document_content: str) -> Dict[str, Any]:
+        """Analyze document and provide insights without blocking the event loop"""
+        try:
+            key = self._response_key("analysis", document_content)
+            content = self._response_cache.get(key)
+            if content is None:
+                content = await self._agenerate(self._analysis_args(document_content))
+            
+            result = self._parse_analysis(content)
+            self._response_cache.put(key, content)
+            return result
             
         except Exception as e:
             raise Exception(f"Failed to analyze document: {str(e)}")
@@ -125,26 +419,39 @@ Respond with JSON in this format:
             "Please fix any grammar mistakes and improve the writing style while keeping the same meaning and structure."
         )
     
+    def _summary_args(self, document_content: str, target_length: str) -> Dict[str, Any]:
+        """Build the generate_content arguments for a document summary"""
+        instruction = _SUMMARY_LENGTHS.get(target_length, _SUMMARY_LENGTHS["medium"])
+        
+        prompt = f"Please summarize the following document {instruction}:\n\n{document_content}"
+        
+        return {
+            'model': self.model,
+            'contents': prompt
+        }
+    
     def summarize_document(self, document_content: str, target_length: str = "medium") -> str:
         """Create a summary of the document"""
         try:
-            length_instructions = {
-                "short": "in 2-3 sentences",
-                "medium": "in 1-2 paragraphs",
-                "long": "in 3-4 paragraphs with key details"
-            }
-            
-            instruction = length_instructions.get(target_length, length_instructions["medium"])
-            
-            prompt = f"Please summarize the following document {instruction}:\n\n{document_content}"
+            key = self._response_key("summary", document_content, target_length)
+            summary = self._response_cache.get(key)
+            if summary is None:
+                summary = self._generate(self._summary_args(document_content, target_length))
+                self._response_cache.put(key, summary)
+            return summary
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
-            )
-            
-            content = response.text
-            return content if content else ""
+        except Exception as e:
+            raise Exception(f"Failed to summarize document: {str(e)}")
+    
+    async def asummarize_document(self, document_content: str, target_length: str = "medium") -> str:
+        """Create a summary of the document without blocking the event loop"""
+        try:
+            key = self._response_key("summary", document_content, target_length)
+            summary = self._response_cache.get(key)
+            if summary is None:
+                summary = await self._agenerate(self._summary_args(document_content, target_length))
+                self._response_cache.put(key, summary)
+            return summary
             
         except Exception as e:
             raise Exception(f"Failed to summarize document: {str(e)}")
@@ -152,25 +459,27 @@ Respond with JSON in this format:
     def generate_chat_response(self, message: str, context: Optional[str] = None) -> str:
         """Generate a general chat response"""
         try:
-            system_prompt = "You are a helpful assistant for document editing. Provide clear, concise responses to user questions about document editing, writing, and content improvement."
+            key = self._response_key("chat", message, context)
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                return cached
             
             if context:
                 user_prompt = f"Context: {context}\n\nUser question: {message}"
             else:
                 user_prompt = message
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=[
+            response_text = self._generate({
+                'model': self.model,
+                'contents': [
                     types.Content(role="user", parts=[types.Part(text=user_prompt)])
                 ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt
+                'config': types.GenerateContentConfig(
+                    system_instruction=_CHAT_SYSTEM_PROMPT
                 )
-            )
-            
-            content = response.text
-            return content if content else ""
+            })
+            self._response_cache.put(key, response_text)
+            return response_text
             
         except Exception as e:
             raise Exception(f"Failed to generate chat response: {str(e)}")
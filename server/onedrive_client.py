@@ -1,8 +1,63 @@
 import os
 import aiohttp
 import asyncio
-from typing import List, Dict, Any, Optional
-import json
+import re
+import tempfile
+import time
+from datetime import datetime
+from typing import IO, Callable, List, Dict, Any, Optional, Union
+import orjson
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+# Documents larger than this spill from memory to a temporary file on disk
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Documents past the first range are fetched as this many parallel Range requests
+_DOWNLOAD_PARTS = 8
+_MIN_RANGE_SIZE = 1 << 20
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+# Larger uploads go through a resumable upload session; fragment sizes must be
+# a multiple of 320 KiB
+_SIMPLE_UPLOAD_MAX_SIZE = 4 * 1024 * 1024
+_UPLOAD_FRAGMENT_SIZE = 16 * 320 * 1024
+# Requests follow user clicks, so keep idle connections well past aiohttp's 15s default
+_KEEPALIVE_TIMEOUT = 120
+# Cap on Graph calls in flight at once, so bulk operations stay clear of throttling
+_MAX_CONCURRENT_REQUESTS = 8
+_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60)
+# Graph accepts at most this many sub-requests in one $batch call
+_BATCH_MAX_REQUESTS = 20
+# Refresh the access token this long before it expires, so it can't lapse mid-request
+_TOKEN_EXPIRY_MARGIN = 60
+# Lifetime assumed for a token the connector sends without an expiry; a 401 still forces a refresh
+_DEFAULT_TOKEN_LIFETIME = 300
+# Item fields list_word_documents reads; search results carry many more by default
+_LIST_SELECT_FIELDS = "id,name,size,file,lastModifiedDateTime,webUrl,@microsoft.graph.downloadUrl"
+# Throttling and server errors are retried; Retry-After is honoured up to a cap
+_RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_RETRY_AFTER = 60
+_backoff = wait_exponential_jitter(initial=1, max=16)
+
+class _RetryableGraphError(Exception):
+    """A throttled or transient Graph error, with the delay the server asked for if any"""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _retry_wait(retry_state) -> float:
+    """Wait as long as Graph asked through Retry-After, or back off exponentially"""
+    retry_after = getattr(retry_state.outcome.exception(), 'retry_after', None)
+    if retry_after is not None:
+        return min(retry_after, _MAX_RETRY_AFTER)
+    return _backoff(retry_state)
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Read a Retry-After header given in seconds"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
 
 class OneDriveClient:
     """Client for interacting with OneDrive via Microsoft Graph API"""
@@ -10,88 +65,143 @@ class OneDriveClient:
     def __init__(self):
         self.graph_url = "https://graph.microsoft.com/v1.0"
         self.connection_settings = None
+        # Created on first use so it binds to the event loop the client runs on
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(_MAX_CONCURRENT_REQUESTS)
+        self._token: Optional[str] = None
+        self._token_exp = 0.0
+        self._token_lock = asyncio.Lock()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, reusing pooled connections across calls"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=32,
+                limit_per_host=16,
+                ttl_dns_cache=300,
+                keepalive_timeout=_KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=_REQUEST_TIMEOUT)
+        return self._session
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
     
     async def _get_access_token(self) -> str:
         """Get a valid access token for Microsoft Graph API"""
         # Check if we have a cached token that's still valid
-        if (self.connection_settings and 
-            self.connection_settings.get('settings', {}).get('expires_at') and
-            self._is_token_valid(self.connection_settings['settings']['expires_at'])):
-            return self.connection_settings['settings']['access_token']
-        
-        # Get fresh token from Replit connector
-        hostname = os.getenv('REPLIT_CONNECTORS_HOSTNAME')
-        x_replit_token = None
+        if self._is_token_valid():
+            return self._token
         
-        repl_identity = os.getenv('REPL_IDENTITY')
-        web_repl_renewal = os.getenv('WEB_REPL_RENEWAL')
-        
-        if repl_identity:
-            x_replit_token = 'repl ' + repl_identity
-        elif web_repl_renewal:
-            x_replit_token = 'depl ' + web_repl_renewal
-        
-        if not x_replit_token:
-            raise Exception('X_REPLIT_TOKEN not found for repl/depl')
-        
-        url = f'https://{hostname}/api/v2/connection?include_secrets=true&connector_names=onedrive'
-        headers = {
-            'Accept': 'application/json',
-            'X_REPLIT_TOKEN': x_replit_token
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
+        # Concurrent callers wait for one refresh instead of each fetching a token
+        async with self._token_lock:
+            if self._is_token_valid():
+                return self._token
+            
+            # Get fresh token from Replit connector
+            hostname = os.getenv('REPLIT_CONNECTORS_HOSTNAME')
+            x_replit_token = None
+            
+            repl_identity = os.getenv('REPL_IDENTITY')
+            web_repl_renewal = os.getenv('WEB_REPL_RENEWAL')
+            
+            if repl_identity:
+                x_replit_token = 'repl ' + repl_identity
+            elif web_repl_renewal:
+                x_replit_token = 'depl ' + web_repl_renewal
+            
+            if not x_replit_token:
+                raise Exception('X_REPLIT_TOKEN not found for repl/depl')
+            
+            url = f'https://{hostname}/api/v2/connection?include_secrets=true&connector_names=onedrive'
+            headers = {
+                'Accept': 'application/json',
+                'X_REPLIT_TOKEN': x_replit_token
+            }
+            
+            session = await self._get_session()
+            async with self._semaphore, session.get(url, headers=headers) as response:
                 if response.status != 200:
                     raise Exception(f'Failed to get connection: {response.status}')
                 
-                data = await response.json()
+                data = await response.json(loads=orjson.loads)
                 self.connection_settings = data.get('items', [{}])[0]
-        
-        access_token = (self.connection_settings.get('settings', {}).get('access_token') or 
-                       self.connection_settings.get('settings', {}).get('oauth', {}).get('credentials', {}).get('access_token'))
-        
-        if not self.connection_settings or not access_token:
-            raise Exception('OneDrive not connected')
-        
-        return access_token
+            
+            access_token = (self.connection_settings.get('settings', {}).get('access_token') or 
+                           self.connection_settings.get('settings', {}).get('oauth', {}).get('credentials', {}).get('access_token'))
+            
+            if not self.connection_settings or not access_token:
+                raise Exception('OneDrive not connected')
+            
+            self._token = access_token
+            self._token_exp = self._parse_expiry(self.connection_settings.get('settings', {}).get('expires_at'))
+            return access_token
     
-    def _is_token_valid(self, expires_at: str) -> bool:
-        """Check if token is still valid"""
+    def _is_token_valid(self) -> bool:
+        """Check if the cached token is still valid"""
+        return bool(self._token) and self._token_exp - time.time() > _TOKEN_EXPIRY_MARGIN
+    
+    def _invalidate_token(self, rejected_token: str) -> None:
+        """Drop a token Graph rejected, unless another request already replaced it"""
+        if self._token == rejected_token:
+            self._token = None
+    
+    def _parse_expiry(self, expires_at: Optional[str]) -> float:
+        """Convert the connector's expiry timestamp to epoch seconds"""
         try:
-            from datetime import datetime
-            expiry = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-            return expiry.timestamp() > datetime.now().timestamp()
-        except:
-            return False
+            return datetime.fromisoformat(expires_at.replace('Z', '+00:00')).timestamp()
+        except (AttributeError, ValueError):
+            return time.time() + _DEFAULT_TOKEN_LIFETIME
     
+    @retry(
+        retry=retry_if_exception_type((_RetryableGraphError, aiohttp.ClientConnectionError, asyncio.TimeoutError)),
+        wait=_retry_wait,
+        stop=stop_after_attempt(5),
+        reraise=True
+    )
     async def _make_graph_request(self, endpoint: str, method: str = 'GET', data: Optional[bytes] = None) -> Dict[str, Any]:
         """Make authenticated request to Microsoft Graph API"""
-        access_token = await self._get_access_token()
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json' if method != 'PUT' else 'application/octet-stream'
-        }
-        
         url = f"{self.graph_url}{endpoint}"
+        session = await self._get_session()
         
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, headers=headers, data=data) as response:
+        for retry_on_401 in (True, False):
+            access_token = await self._get_access_token()
+            
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json' if method != 'PUT' else 'application/octet-stream'
+            }
+            
+            async with self._semaphore, session.request(method, url, headers=headers, data=data) as response:
+                # The token was revoked or expired early; fetch a fresh one and try once more
+                if response.status == 401 and retry_on_401:
+                    self._invalidate_token(access_token)
+                    continue
+                
                 if response.status >= 400:
                     error_text = await response.text()
+                    if response.status in _RETRYABLE_STATUSES:
+                        raise _RetryableGraphError(
+                            f'Graph API error {response.status}: {error_text}',
+                            _parse_retry_after(response.headers.get('Retry-After'))
+                        )
                     raise Exception(f'Graph API error {response.status}: {error_text}')
                 
-                if method == 'GET':
-                    return await response.json()
+                if method in ('GET', 'POST'):
+                    return await response.json(loads=orjson.loads)
                 else:
                     return {}
     
     async def list_word_documents(self) -> List[Dict[str, Any]]:
         """List all Word documents in OneDrive"""
         try:
-            # Search for .docx files
-            endpoint = "/me/drive/root/search(q='.docx')"
+            # Search for .docx files, fetching only the fields listed below
+            endpoint = (
+                "/me/drive/root/search(q='.docx')"
+                f"?$select={_LIST_SELECT_FIELDS}&$orderby=lastModifiedDateTime desc"
+            )
             response = await self._make_graph_request(endpoint)
             
             word_docs = []
@@ -109,40 +219,166 @@ class OneDriveClient:
                         'downloadUrl': item.get('@microsoft.graph.downloadUrl')
                     })
             
+            # Search may ignore $orderby on some drive types, so keep the (cheap) client-side sort
             return sorted(word_docs, key=lambda x: x.get('lastModified', ''), reverse=True)
             
         except Exception as e:
             raise Exception(f"Failed to list Word documents: {str(e)}")
     
-    async def download_document(self, file_id: str) -> bytes:
-        """Download a Word document by file ID"""
+    async def download_document(self, file_id: str) -> IO[bytes]:
+        """Stream a Word document by file ID into a spooled temporary file"""
         try:
             endpoint = f"/me/drive/items/{file_id}/content"
-            access_token = await self._get_access_token()
-            
-            headers = {'Authorization': f'Bearer {access_token}'}
             url = f"{self.graph_url}{endpoint}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
+            spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+            session = await self._get_session()
+            for retry_on_401 in (True, False):
+                access_token = await self._get_access_token()
+                
+                # Ask for the first range only; a 206 reply also carries the total size
+                headers = {
+                    'Authorization': f'Bearer {access_token}',
+                    'Range': f'bytes=0-{_MIN_RANGE_SIZE - 1}'
+                }
+                
+                async with self._semaphore, session.get(url, headers=headers) as response:
+                    if response.status == 401 and retry_on_401:
+                        self._invalidate_token(access_token)
+                        continue
+                    
                     if response.status >= 400:
                         error_text = await response.text()
                         raise Exception(f'Download failed {response.status}: {error_text}')
                     
-                    return await response.read()
+                    # A 200 means the server ignored the range and is sending the whole file
+                    written = await self._write_range(response, spool, 0)
+                    
+                    ranged = response.status == 206
+                    total = written
+                    if ranged:
+                        match = _CONTENT_RANGE.fullmatch(response.headers.get('Content-Range', ''))
+                        if match and (int(match[1]), int(match[2]) + 1) != (0, written):
+                            raise Exception(f'Range download returned an unexpected range: {match[0]}')
+                        total = int(match[3]) if match and match[3] != '*' else None
+                    
+                    # Graph redirects to a pre-authenticated URL, which must not carry the bearer token
+                    download_url = response.url
+                    range_headers = {} if response.history else {'Authorization': f'Bearer {access_token}'}
+                    break
+            
+            if ranged and total is None:
+                # Without the total size the remaining ranges can't be planned, so start over
+                # with a single request for the whole file
+                spool.seek(0)
+                spool.truncate()
+                await self._download_range(download_url, range_headers, spool, 0, None)
+            elif ranged and total > written:
+                # Continue from what the first reply actually covered, which may be less than asked
+                part_size = max(-(-(total - written) // _DOWNLOAD_PARTS), _MIN_RANGE_SIZE)
+                await asyncio.gather(*(
+                    self._download_range(download_url, range_headers, spool, start, min(start + part_size, total) - 1)
+                    for start in range(written, total, part_size)
+                ))
+            
+            spool.seek(0)
+            return spool
                     
         except Exception as e:
             raise Exception(f"Failed to download document: {str(e)}")
     
-    async def upload_document(self, file_id: str, content: bytes) -> Dict[str, Any]:
-        """Upload/update a Word document"""
+    async def download_documents(self, file_ids: List[str]) -> Dict[str, Union[IO[bytes], Exception]]:
+        """Download several documents concurrently; a failed download maps to its exception"""
+        results = await asyncio.gather(
+            *(self.download_document(file_id) for file_id in file_ids),
+            return_exceptions=True
+        )
+        return dict(zip(file_ids, results))
+    
+    async def _download_range(self, url, headers: Dict[str, str], spool: IO[bytes],
+                              start: int, end: Optional[int]) -> None:
+        """Fetch bytes start..end (inclusive) of a download into the same offsets of spool, or all of it if end is None"""
+        if end is not None:
+            headers = {**headers, 'Range': f'bytes={start}-{end}'}
+        expected_status = 200 if end is None else 206
+        
+        session = await self._get_session()
+        async with self._semaphore, session.get(url, headers=headers) as response:
+            if response.status != expected_status:
+                error_text = await response.text()
+                raise Exception(f'Range download failed {response.status}: {error_text}')
+            written = await self._write_range(response, spool, start)
+        
+        # A short body would otherwise leave a zero-filled gap in the document
+        if end is not None and written != end - start + 1:
+            raise Exception(f'Range download returned {written} of {end - start + 1} bytes')
+    
+    async def _write_range(self, response: aiohttp.ClientResponse, spool: IO[bytes], offset: int) -> int:
+        """Copy a response body into spool starting at offset, returning the number of bytes written"""
+        # Ranges arrive interleaved, so every chunk seeks to its own position first
+        written = 0
+        async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+            spool.seek(offset + written)
+            spool.write(chunk)
+            written += len(chunk)
+        return written
+    
+    async def upload_document(self, file_id: str, content: bytes,
+                              progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Upload/update a Word document, reporting (bytes_sent, total_bytes) to progress_callback"""
         try:
-            endpoint = f"/me/drive/items/{file_id}/content"
-            return await self._make_graph_request(endpoint, method='PUT', data=content)
+            if len(content) <= _SIMPLE_UPLOAD_MAX_SIZE:
+                endpoint = f"/me/drive/items/{file_id}/content"
+                result = await self._make_graph_request(endpoint, method='PUT', data=content)
+                if progress_callback:
+                    progress_callback(len(content), len(content))
+                return result
+            
+            return await self._upload_in_fragments(file_id, content, progress_callback)
             
         except Exception as e:
             raise Exception(f"Failed to upload document: {str(e)}")
     
+    async def _upload_in_fragments(self, file_id: str, content: bytes,
+                                   progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Upload a large document through a resumable upload session"""
+        endpoint = f"/me/drive/items/{file_id}/createUploadSession"
+        body = orjson.dumps({'item': {'@microsoft.graph.conflictBehavior': 'replace'}})
+        upload_session = await self._make_graph_request(endpoint, method='POST', data=body)
+        upload_url = upload_session['uploadUrl']
+        
+        total = len(content)
+        view = memoryview(content)
+        result: Dict[str, Any] = {}
+        
+        # Graph requires fragments to arrive in order, so they are sent one at a time.
+        # The upload URL is pre-authenticated and must not carry the bearer token.
+        session = await self._get_session()
+        try:
+            for start in range(0, total, _UPLOAD_FRAGMENT_SIZE):
+                end = min(start + _UPLOAD_FRAGMENT_SIZE, total)
+                headers = {'Content-Range': f'bytes {start}-{end - 1}/{total}'}
+                async with self._semaphore, session.put(upload_url, headers=headers, data=view[start:end]) as response:
+                    if response.status >= 400:
+                        error_text = await response.text()
+                        raise Exception(f'Fragment upload failed {response.status}: {error_text}')
+                    
+                    if progress_callback:
+                        progress_callback(end, total)
+                    
+                    if end == total:
+                        result = await response.json(loads=orjson.loads)
+        except Exception:
+            # Release the session on the server side; the original error is what matters
+            try:
+                async with session.delete(upload_url):
+                    pass
+            except aiohttp.ClientError:
+                pass
+            raise
+        
+        return result
+    
     async def get_file_info(self, file_id: str) -> Dict[str, Any]:
         """Get detailed information about a file"""
         try:
@@ -151,3 +387,31 @@ class OneDriveClient:
             
         except Exception as e:
             raise Exception(f"Failed to get file info: {str(e)}")
+    
+    async def get_files_info(self, file_ids: List[str]) -> Dict[str, Union[Dict[str, Any], Exception]]:
+        """Get information about several files through Graph $batch; a failed lookup maps to its exception"""
+        try:
+            batches = [file_ids[i:i + _BATCH_MAX_REQUESTS] for i in range(0, len(file_ids), _BATCH_MAX_REQUESTS)]
+            responses = await asyncio.gather(*(
+                self._make_graph_request('/$batch', method='POST', data=orjson.dumps({
+                    'requests': [
+                        {'id': str(i), 'method': 'GET', 'url': f'/me/drive/items/{file_id}'}
+                        for i, file_id in enumerate(batch)
+                    ]
+                }))
+                for batch in batches
+            ))
+            
+            results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+            for batch, response in zip(batches, responses):
+                for item in response.get('responses', []):
+                    file_id = batch[int(item['id'])]
+                    if item.get('status', 500) >= 400:
+                        error = item.get('body', {}).get('error', {}).get('message', '')
+                        results[file_id] = Exception(f"Graph API error {item.get('status')}: {error}")
+                    else:
+                        results[file_id] = item.get('body', {})
+            return results
+            
+        except Exception as e:
+            raise Exception(f"Failed to get file info: {str(e)}")
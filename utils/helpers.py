@@ -1,20 +1,32 @@
 import datetime
+import hashlib
+from collections import Counter
 from typing import Any, Optional
 
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+# Common words ignored by extract_key_phrases
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those'
+})
+
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
     if size_bytes == 0:
         return "0 B"
     
-    size_names = ["B", "KB", "MB", "GB"]
-    i = 0
-    size = float(size_bytes)
-    
-    while size >= 1024.0 and i < len(size_names) - 1:
-        size /= 1024.0
-        i += 1
+    # Each unit is 2**10 times the last, so the bit length picks the unit directly
+    i = min((abs(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (10 * i)):.1f} {_SIZE_UNITS[i]}"
+
+def content_hash(text: Optional[str]) -> Optional[str]:
+    """Get a short fingerprint of text content for cheap change detection"""
+    if text is None:
+        return None
     
-    return f"{size:.1f} {size_names[i]}"
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
 def truncate_text(text: str, max_length: int) -> str:
     """Truncate text to specified length with ellipsis"""
@@ -46,41 +58,21 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove excessive whitespace
-    text = ' '.join(text.split())
-    
-    # Remove multiple consecutive newlines
-    while '\n\n\n' in text:
-        text = text.replace('\n\n\n', '\n\n')
-    
-    return text.strip()
+    # Collapse every whitespace run, newlines included, to a single space. split()
+    # also drops leading and trailing whitespace, and beats an equivalent re.sub
+    return ' '.join(text.split())
 
 def extract_key_phrases(text: str, max_phrases: int = 5) -> list:
     """Extract key phrases from text (simple implementation)"""
     if not text:
         return []
     
-    # Simple keyword extraction based on word frequency
+    # Simple keyword extraction based on word frequency, skipping common stop words
     words = text.lower().split()
+    word_freq = Counter(word for word in words if len(word) > 3 and word not in _STOP_WORDS)
     
-    # Remove common stop words
-    stop_words = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
-        'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those'
-    }
-    
-    filtered_words = [word for word in words if word not in stop_words and len(word) > 3]
-    
-    # Count frequency
-    word_freq = {}
-    for word in filtered_words:
-        word_freq[word] = word_freq.get(word, 0) + 1
-    
-    # Sort by frequency and return top phrases
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    
-    return [word for word, freq in sorted_words[:max_phrases]]
+    # most_common keeps first-seen order among equally frequent words, like a stable sort
+    return [word for word, freq in word_freq.most_common(max_phrases)]
 
 def validate_text_content(content: str) -> dict:
     """Validate text content and return analysis"""
@@ -126,15 +118,15 @@ def parse_table_content(text: str) -> list:
     
     current_table = []
     for line in lines:
-        if '|' in line and line.count('|') >= 2:
-            # This looks like a table row
-            cells = [cell.strip() for cell in line.split('|')]
-            current_table.append(cells)
-        else:
+        # Split once and count the pieces, rather than counting | and then splitting
+        cells = line.split('|') if '|' in line else None
+        if cells is not None and len(cells) >= 3:
+            # This looks like a table row (at least two |)
+            current_table.append([cell.strip() for cell in cells])
+        elif current_table:
             # End of table
-            if current_table:
-                tables.append(current_table)
-                current_table = []
+            tables.append(current_table)
+            current_table = []
     
     # Don't forget the last table
     if current_table: